@@ -0,0 +1,105 @@
+"""
+Sales analytics shared by the Lambda function, the local test script and the ETL pipeline
+Every helper takes a pyarrow Table of active (non-cancelled) orders; string columns
+may be plain or dictionary-encoded
+"""
+
+import pyarrow.compute as pc
+
+def calculate_kpis(table):
+    """Calculate key performance indicators"""
+    # Arrow's sum/count kernels skip nulls, matching pandas' NaN handling
+    amount = table['Amount']
+    total_revenue = pc.sum(amount).as_py() or 0.0
+    amount_count = pc.count(amount).as_py()
+    total_quantity = pc.sum(table['Qty']).as_py() or 0
+    
+    # B2B vs B2C split
+    if 'B2B' in table.column_names:
+        b2b_revenue = pc.sum(pc.filter(amount, pc.fill_null(table['B2B'], False))).as_py() or 0.0
+    else:
+        b2b_revenue = 0.0
+    
+    # value_counts works on both dictionary-encoded and plain string columns
+    fulfillment_counts = {
+        row['values']: row['counts'] for row in pc.value_counts(table['fulfilled-by']).to_pylist()
+    }
+    amazon_fulfilled = fulfillment_counts.get('Amazon', 0)
+    merchant_fulfilled = fulfillment_counts.get('Merchant', 0)
+    
+    total_orders = table.num_rows
+    avg_order_value = total_revenue / amount_count if amount_count else float('nan')
+    b2c_revenue = total_revenue - b2b_revenue
+    
+    return {
+        'total_revenue': round(total_revenue, 2),
+        'total_orders': total_orders,
+        'average_order_value': round(avg_order_value, 2),
+        'total_quantity_sold': int(total_quantity),
+        'b2b_revenue': round(b2b_revenue, 2),
+        'b2c_revenue': round(b2c_revenue, 2),
+        'amazon_fulfilled_orders': int(amazon_fulfilled),
+        'merchant_fulfilled_orders': int(merchant_fulfilled)
+    }
+
+def group_totals(table, keys, aggregations, names):
+    """Hash-aggregate table by keys in Arrow, dropping null keys and renaming all columns to names"""
+    grouped = table.group_by(keys).aggregate(aggregations)
+    outputs = [f"{column}_{func}" if column else func for column, func in aggregations]
+    grouped = grouped.select(keys + outputs).rename_columns(names)
+    
+    for name in names[:len(keys)]:
+        grouped = grouped.filter(pc.is_valid(grouped[name]))
+    
+    return grouped
+
+def round_revenue(grouped):
+    """Round the revenue column of a grouped table to two decimals"""
+    index = grouped.schema.get_field_index('revenue')
+    return grouped.set_column(index, 'revenue', pc.round(grouped['revenue'], 2))
+
+def get_regional_analytics(table):
+    """Get top performing regions"""
+    regional = round_revenue(group_totals(
+        table, ['ship-state'],
+        [('Amount', 'sum'), ([], 'count_all')],
+        ['ship-state', 'revenue', 'order_count']
+    ))
+    return regional.sort_by([('revenue', 'descending')]).slice(0, 10).to_pylist()
+
+def get_category_performance(table):
+    """Analyze performance by product category"""
+    category = round_revenue(group_totals(
+        table, ['Category'],
+        [('Amount', 'sum'), ('Qty', 'sum'), ([], 'count_all')],
+        ['Category', 'revenue', 'quantity_sold', 'order_count']
+    ))
+    return category.sort_by([('revenue', 'descending')]).to_pylist()
+
+def get_monthly_trends(table):
+    """Calculate monthly revenue trends"""
+    monthly = round_revenue(group_totals(
+        table, ['Year', 'Month'],
+        [('Amount', 'sum'), ([], 'count_all')],
+        ['Year', 'Month', 'revenue', 'order_count']
+    ))
+    monthly = monthly.sort_by([('Year', 'ascending'), ('Month', 'ascending')])
+    
+    # Format the label once per month instead of once per order
+    return [
+        {
+            'YearMonth': f"{row['Year']}-{row['Month']:02d}",
+            'revenue': row['revenue'],
+            'order_count': row['order_count']
+        }
+        for row in monthly.to_pylist()
+    ]
+
+def compute_all(table):
+    """Compute the KPIs and the regional, category and monthly analytics for active orders"""
+    return {
+        'kpis': calculate_kpis(table),
+        'regional': get_regional_analytics(table),
+        'category': get_category_performance(table),
+        'monthly': get_monthly_trends(table)
+    }
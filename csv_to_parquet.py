@@ -0,0 +1,43 @@
+"""
+One-shot conversion of the cleaned sales CSV into a partitioned Parquet dataset
+Run this once, then upload the output directory to S3
+"""
+
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CSV_FILE_PATH = "Cleaned_Amazon_Sale_Report.csv"
+PARQUET_DIR = "sales_parquet"
+
+def convert(csv_file_path=CSV_FILE_PATH, parquet_dir=PARQUET_DIR):
+    """Convert the sales CSV to Parquet partitioned by Year/Month"""
+    print(f"Reading {csv_file_path}...")
+    df = pd.read_csv(csv_file_path)
+
+    # Store typed columns so readers never re-parse strings
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+    df['Qty'] = pd.to_numeric(df['Qty'], errors='coerce')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Fixed file names and delete_matching make re-runs replace partitions instead of adding copies
+    pq.write_to_dataset(
+        table,
+        root_path=parquet_dir,
+        partition_cols=['Year', 'Month'],
+        basename_template='part-{i}.parquet',
+        existing_data_behavior='delete_matching'
+    )
+
+    print(f"Wrote {len(df)} records to {parquet_dir}/")
+    return parquet_dir
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        convert(sys.argv[1], sys.argv[2])
+    else:
+        convert()
+    print("\nUpload with: aws s3 sync sales_parquet s3://your-bucket/etl-output/sales_parquet --delete")
@@ -1,22 +1,104 @@
+import os
+import calendar
 import pandas as pd
 import numpy as np
-import json
-import boto3
+import duckdb
+import orjson
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from datetime import datetime
-from io import StringIO
+from pathlib import Path
+
+from analytics import group_totals
+from sales_source import CATEGORICAL_COLUMNS, SOURCE_PARTITIONING, s3_client, s3_filesystem
+
+# Columns used by transform and the aggregations; everything else stays in S3
+SOURCE_COLUMNS = [
+    'Date', 'Status', 'Category', 'Size', 'Qty', 'Amount',
+    'ship-state', 'B2B', 'fulfilled-by', 'Year', 'Month'
+]
+
+# Month labels are attached per group rather than read and grouped per row
+MONTH_NAMES = {month: calendar.month_abbr[month] for month in range(1, 13)}
+
+def with_month_names(rows):
+    """Add month_name right after year/month in each monthly aggregation row"""
+    return [
+        {'year': row['year'], 'month': row['month'], 'month_name': MONTH_NAMES[row['month']], **row}
+        for row in rows
+    ]
+
+def arrow_to_pandas_type(arrow_type):
+    """Map dictionary columns to pandas categoricals and everything else to ArrowDtype"""
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+DUCKDB_KPI_QUERY = """
+    SELECT
+        COALESCE(SUM(Amount) FILTER (WHERE active), 0) AS total_revenue,
+        COUNT(*) FILTER (WHERE active) AS total_orders,
+        COALESCE(SUM(Qty) FILTER (WHERE active), 0) AS total_quantity,
+        SUM(COALESCE(Amount, 0)) FILTER (WHERE active) / COUNT(*) FILTER (WHERE active) AS average_order_value,
+        COUNT(*) FILTER (WHERE NOT active) AS cancelled_orders,
+        COUNT(*) AS total_records
+    FROM (SELECT Amount, Qty, Status IS DISTINCT FROM 'Cancelled' AS active FROM sales)
+"""
+
+DUCKDB_GROUP_QUERY = """
+    SELECT {keys}, SUM(Amount) AS revenue, CAST(SUM(Qty) AS BIGINT) AS quantity, COUNT(*) AS order_count
+    FROM sales
+    WHERE Status IS DISTINCT FROM 'Cancelled' AND {not_null}
+    GROUP BY ALL
+    ORDER BY {order_by}
+"""
+
+# 'arrow' aggregates the extracted frame with analytics.group_totals; 'duckdb' runs SQL over Parquet
+ENGINES = ('arrow', 'duckdb')
 
 class SalesETLPipeline:
     """ETL Pipeline for Amazon Sales Data"""
     
-    def __init__(self, s3_bucket_name):
+    def __init__(self, s3_bucket_name, engine='arrow'):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join(ENGINES)}")
+        
         self.s3_bucket_name = s3_bucket_name
-        self.s3_client = boto3.client('s3')
+        self.s3_client = s3_client
+        self.engine = engine
         self.df = None
-        
-    def extract(self, csv_file_path):
-        """Extract data from CSV file"""
-        print(f"Extracting data from {csv_file_path}...")
-        self.df = pd.read_csv(csv_file_path)
+        self.json_payload = None
+        self.total_records = None
+        self.active_records = None
+        self._aggregations = None
+        
+    def _resolve_source(self, source_path):
+        """Split an s3:// URI into the pyarrow path and filesystem to read it with"""
+        if source_path.startswith('s3://'):
+            return source_path[len('s3://'):], s3_filesystem
+        return source_path, None
+    
+    def read_source(self, source_path, filters=None):
+        """Read the projected columns of a Parquet dataset (s3:// or local path)"""
+        source_path, filesystem = self._resolve_source(source_path)
+        
+        table = pq.read_table(
+            source_path,
+            filesystem=filesystem,
+            columns=SOURCE_COLUMNS,
+            filters=filters,
+            partitioning=SOURCE_PARTITIONING,
+            read_dictionary=CATEGORICAL_COLUMNS
+        )
+        
+        return table.to_pandas(types_mapper=arrow_to_pandas_type)
+    
+    def extract(self, source_path):
+        """Extract data from the Parquet dataset"""
+        print(f"Extracting data from {source_path}...")
+        # Cancelled rows are kept here because the KPIs report the cancellation rate
+        self.df = self.read_source(source_path)
         print(f"Extracted {len(self.df)} records")
         return self.df
     
@@ -27,8 +109,9 @@ class SalesETLPipeline:
         if self.df is None:
             raise ValueError("No data to transform. Please run extract() first.")
         
-        # Convert Date column to datetime
-        self.df['Date'] = pd.to_datetime(self.df['Date'])
+        # Convert Date column to datetime (Parquet sources already store a timestamp)
+        if pd.api.types.is_string_dtype(self.df['Date']):
+            self.df['Date'] = pd.to_datetime(self.df['Date'], format='ISO8601')
         
         # Convert Amount to numeric
         self.df['Amount'] = pd.to_numeric(self.df['Amount'], errors='coerce')
@@ -36,13 +119,25 @@ class SalesETLPipeline:
         # Convert Qty to numeric
         self.df['Qty'] = pd.to_numeric(self.df['Qty'], errors='coerce')
         
-        # Remove cancelled orders for revenue calculations
-        self.df_active = self.df[self.df['Status'] != 'Cancelled'].copy()
+        # Group and filter keys compare as integer codes once categorical
+        for col in CATEGORICAL_COLUMNS:
+            if col in self.df and not isinstance(self.df[col].dtype, pd.CategoricalDtype):
+                self.df[col] = self.df[col].astype('category')
+        
+        # Remove cancelled orders for revenue calculations; the mask is reused by calculate_kpis
+        self._cancel_mask = (self.df['Status'] == 'Cancelled').to_numpy(dtype=bool)
+        self.df_active = self.df[~self._cancel_mask].copy()
+        self.total_records = len(self.df)
+        self.active_records = len(self.df_active)
         
         # Fill NaN values
         self.df_active['Amount'] = self.df_active['Amount'].fillna(0)
         self.df_active['Qty'] = self.df_active['Qty'].fillna(0)
         
+        # Arrow view of the active orders for the shared aggregation helpers
+        self.table_active = pa.Table.from_pandas(self.df_active, preserve_index=False)
+        self._aggregations = None
+        
         print(f"Transformed data: {len(self.df_active)} active orders")
         return self.df_active
     
@@ -53,83 +148,123 @@ class SalesETLPipeline:
         if self.df is None:
             raise ValueError("No data to calculate KPIs. Please run extract() first.")
         
+        # Cancelled count comes from the mask built in transform, not another Status scan
+        cancelled_orders = int(self._cancel_mask.sum())
+        total_records = len(self.df)
+        
         kpis = {
             'total_revenue': float(self.df_active['Amount'].sum()),
             'total_orders': int(len(self.df_active)),
             'total_quantity': int(self.df_active['Qty'].sum()),
             'average_order_value': float(self.df_active['Amount'].mean()),
-            'cancelled_orders': int(len(self.df[self.df['Status'] == 'Cancelled'])),
-            'cancellation_rate': float(len(self.df[self.df['Status'] == 'Cancelled']) / len(self.df) * 100)
+            'cancelled_orders': cancelled_orders,
+            'cancellation_rate': float(cancelled_orders / total_records * 100)
         }
         
         return kpis
     
+    def _group_totals(self, keys, names):
+        """Revenue, quantity and order count of active orders grouped by keys"""
+        return group_totals(
+            self.table_active, keys,
+            [('Amount', 'sum'), ('Qty', 'sum'), ([], 'count_all')],
+            names + ['revenue', 'quantity', 'order_count']
+        )
+    
     def aggregate_by_state(self):
         """Aggregate sales by state"""
         print("Aggregating by state...")
-        
-        state_agg = self.df_active.groupby('ship-state').agg({
-            'Amount': 'sum',
-            'Qty': 'sum',
-            'Order ID': 'count'
-        }).reset_index()
-        
-        state_agg.columns = ['state', 'revenue', 'quantity', 'order_count']
-        state_agg = state_agg.sort_values('revenue', ascending=False)
-        
-        return state_agg.to_dict('records')
+        state_agg = self._group_totals(['ship-state'], ['state'])
+        return state_agg.sort_by([('revenue', 'descending')]).to_pylist()
     
     def aggregate_by_category(self):
         """Aggregate sales by category"""
         print("Aggregating by category...")
-        
-        category_agg = self.df_active.groupby('Category').agg({
-            'Amount': 'sum',
-            'Qty': 'sum',
-            'Order ID': 'count'
-        }).reset_index()
-        
-        category_agg.columns = ['category', 'revenue', 'quantity', 'order_count']
-        category_agg = category_agg.sort_values('revenue', ascending=False)
-        
-        return category_agg.to_dict('records')
+        category_agg = self._group_totals(['Category'], ['category'])
+        return category_agg.sort_by([('revenue', 'descending')]).to_pylist()
     
     def aggregate_by_month(self):
         """Aggregate sales by month"""
         print("Aggregating by month...")
-        
-        month_agg = self.df_active.groupby(['Year', 'Month', 'MonthName']).agg({
-            'Amount': 'sum',
-            'Qty': 'sum',
-            'Order ID': 'count'
-        }).reset_index()
-        
-        month_agg.columns = ['year', 'month', 'month_name', 'revenue', 'quantity', 'order_count']
-        month_agg = month_agg.sort_values(['year', 'month'])
-        
-        return month_agg.to_dict('records')
+        month_agg = self._group_totals(['Year', 'Month'], ['year', 'month'])
+        return with_month_names(month_agg.sort_by([('year', 'ascending'), ('month', 'ascending')]).to_pylist())
     
     def aggregate_by_size(self):
         """Aggregate sales by size"""
         print("Aggregating by size...")
+        size_agg = self._group_totals(['Size'], ['size'])
+        return size_agg.sort_by([('revenue', 'descending')]).to_pylist()
+    
+    def aggregate_all(self):
+        """Run the state, category, month and size aggregations"""
+        # Cached so get_top_performers can reuse the results without regrouping
+        self._aggregations = {
+            'by_state': self.aggregate_by_state(),
+            'by_category': self.aggregate_by_category(),
+            'by_month': self.aggregate_by_month(),
+            'by_size': self.aggregate_by_size()
+        }
+        
+        return self._aggregations
+    
+    def aggregate_with_duckdb(self, source_path):
+        """Compute the KPIs and all aggregations in one DuckDB session over the Parquet dataset"""
+        print(f"Aggregating {source_path} with DuckDB...")
+        
+        source_path, filesystem = self._resolve_source(source_path)
+        dataset = ds.dataset(source_path, filesystem=filesystem, partitioning=SOURCE_PARTITIONING)
         
-        size_agg = self.df_active.groupby('Size').agg({
-            'Amount': 'sum',
-            'Qty': 'sum',
-            'Order ID': 'count'
-        }).reset_index()
+        # DuckDB scans the Arrow dataset directly, pushing projections and filters into the read
+        con = duckdb.connect()
+        try:
+            con.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+            con.register('sales', dataset)
+            
+            kpi_row = con.execute(DUCKDB_KPI_QUERY).fetchdf().to_dict('records')[0]
+            
+            def group(keys, order_by):
+                query = DUCKDB_GROUP_QUERY.format(
+                    keys=', '.join(f'"{key}" AS {name}' for key, name in keys),
+                    not_null=' AND '.join(f'"{key}" IS NOT NULL' for key, _ in keys),
+                    order_by=order_by
+                )
+                return con.execute(query).fetchdf().to_dict('records')
+            
+            grouped = {
+                'by_state': group([('ship-state', 'state')], 'revenue DESC'),
+                'by_category': group([('Category', 'category')], 'revenue DESC'),
+                'by_month': group([('Year', 'year'), ('Month', 'month')], 'year, month'),
+                'by_size': group([('Size', 'size')], 'revenue DESC')
+            }
+        finally:
+            con.close()
+        
+        grouped['by_month'] = with_month_names(grouped['by_month'])
+        
+        self.total_records = int(kpi_row['total_records'])
+        self.active_records = int(kpi_row['total_orders'])
+        self._aggregations = grouped
         
-        size_agg.columns = ['size', 'revenue', 'quantity', 'order_count']
-        size_agg = size_agg.sort_values('revenue', ascending=False)
+        kpis = {
+            'total_revenue': float(kpi_row['total_revenue']),
+            'total_orders': int(kpi_row['total_orders']),
+            'total_quantity': int(kpi_row['total_quantity']),
+            'average_order_value': float(kpi_row['average_order_value']),
+            'cancelled_orders': int(kpi_row['cancelled_orders']),
+            'cancellation_rate': float(kpi_row['cancelled_orders'] / kpi_row['total_records'] * 100)
+        }
         
-        return size_agg.to_dict('records')
+        return kpis, grouped
     
     def get_top_performers(self):
         """Get top performing metrics"""
         print("Calculating top performers...")
         
-        state_data = self.aggregate_by_state()
-        category_data = self.aggregate_by_category()
+        if self._aggregations is None:
+            self.aggregate_all()
+        
+        state_data = self._aggregations['by_state']
+        category_data = self._aggregations['by_category']
         
         top_performers = {
             'top_state': state_data[0] if state_data else None,
@@ -144,19 +279,24 @@ class SalesETLPipeline:
         """Load aggregated data to S3"""
         print(f"Loading data to S3: s3://{self.s3_bucket_name}/{key}")
         
-        if self.df is None:
+        if self.total_records is None:
             raise ValueError("No data available. Please run extract() first.")
         
         # Add metadata
         aggregated_data['metadata'] = {
             'last_updated': datetime.now().isoformat(),
-            'total_records_processed': len(self.df),
-            'active_orders_processed': len(self.df_active),
+            'total_records_processed': self.total_records,
+            'active_orders_processed': self.active_records,
             'pipeline_version': '1.0'
         }
         
-        # Convert to JSON
-        json_data = json.dumps(aggregated_data, indent=2, default=str)
+        # Convert to JSON bytes (numpy scalars and datetimes serialize natively)
+        json_data = orjson.dumps(
+            aggregated_data,
+            default=str,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_INDENT_2
+        )
+        self.json_payload = json_data
         
         # Upload to S3
         try:
@@ -172,43 +312,45 @@ class SalesETLPipeline:
             print(f"Error uploading to S3: {str(e)}")
             return False
     
-    def run_pipeline(self, csv_file_path):
+    def run_pipeline(self, source_path):
         """Run the complete ETL pipeline"""
         print("="*50)
         print("Starting ETL Pipeline")
         print("="*50)
         
-        # Extract
-        self.extract(csv_file_path)
+        if self.engine == 'duckdb':
+            # DuckDB reads the Parquet dataset and computes everything in SQL
+            kpis, grouped = self.aggregate_with_duckdb(source_path)
+        else:
+            # Extract
+            self.extract(source_path)
+            
+            # Transform
+            self.transform()
+            
+            # Calculate all aggregations
+            kpis = self.calculate_kpis()
+            grouped = self.aggregate_all()
         
-        # Transform
-        self.transform()
-        
-        # Calculate all aggregations
-        kpis = self.calculate_kpis()
-        state_data = self.aggregate_by_state()
-        category_data = self.aggregate_by_category()
-        month_data = self.aggregate_by_month()
-        size_data = self.aggregate_by_size()
         top_performers = self.get_top_performers()
         
         # Prepare aggregated data
         aggregated_data = {
             'kpis': kpis,
-            'by_state': state_data,
-            'by_category': category_data,
-            'by_month': month_data,
-            'by_size': size_data,
+            'by_state': grouped['by_state'],
+            'by_category': grouped['by_category'],
+            'by_month': grouped['by_month'],
+            'by_size': grouped['by_size'],
             'top_performers': top_performers
         }
         
         # Load to S3
         success = self.load_to_s3(aggregated_data)
         
-        # Also save locally for reference
-        with open('aggregated_sales.json', 'w') as f:
-            json.dump(aggregated_data, f, indent=2, default=str)
-        print("Saved local copy: aggregated_sales.json")
+        # Local copy is opt-in (Lambda's filesystem is read-only) and reuses the S3 payload
+        if os.environ.get('ETL_LOCAL_DUMP') == '1':
+            Path('aggregated_sales.json').write_bytes(self.json_payload)
+            print("Saved local copy: aggregated_sales.json")
         
         print("="*50)
         print("ETL Pipeline Completed Successfully!")
@@ -228,13 +370,15 @@ class SalesETLPipeline:
 if __name__ == "__main__":
     # Configuration
     S3_BUCKET_NAME = "sales-etl-data-yourname"  # Change this to your bucket name
-    CSV_FILE_PATH = "Cleaned_Amazon_Sale_Report.csv"
+    SOURCE_PATH = f"s3://{S3_BUCKET_NAME}/etl-output/sales_parquet"  # Written by csv_to_parquet.py
+    
+    ENGINE = os.environ.get('ETL_ENGINE', 'arrow')  # 'arrow' or 'duckdb'
     
     # Initialize and run pipeline
-    pipeline = SalesETLPipeline(S3_BUCKET_NAME)
+    pipeline = SalesETLPipeline(S3_BUCKET_NAME, engine=ENGINE)
     
     try:
-        results = pipeline.run_pipeline(CSV_FILE_PATH)
+        results = pipeline.run_pipeline(SOURCE_PATH)
         print("\n✅ Pipeline executed successfully!")
     except Exception as e:
         print(f"\n❌ Pipeline failed: {str(e)}")
@@ -0,0 +1,31 @@
+"""
+S3 clients and Parquet source layout shared by the Lambda function, the local test
+script and the ETL pipeline
+"""
+
+import os
+import boto3
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+from botocore.config import Config
+
+# AWS clients are built once per process (or Lambda container) so calls reuse connections
+S3_CONFIG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'max_attempts': 4, 'mode': 'adaptive'}
+)
+s3_client = boto3.client('s3', config=S3_CONFIG)
+s3_filesystem = pafs.S3FileSystem(
+    region=os.environ.get('AWS_REGION'),
+    retry_strategy=pafs.AwsStandardS3RetryStrategy(max_attempts=4)
+)
+
+# Low-cardinality strings, read dictionary-encoded; columns a reader does not project are ignored
+CATEGORICAL_COLUMNS = ['Status', 'Category', 'Size', 'ship-state', 'fulfilled-by']
+
+# Year/Month are hive partition keys written by csv_to_parquet.py
+SOURCE_PARTITIONING = ds.partitioning(
+    pa.schema([('Year', pa.int32()), ('Month', pa.int32())]), flavor='hive'
+)